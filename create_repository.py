@@ -1,17 +1,27 @@
-from migrate_repo import get_github_instance
-import sys
+from migrate_repo import get_github_instance, github_graphql
+import argparse
+import functools
+import json
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from github import Github
 from github.Repository import Repository
 from github.Organization import Organization
 
 ORGANIZATION = "launchbynttdata"
+MAX_CONCURRENT_CREATES = 5
 PERMISSIONS = {
     "platform-team": "maintain",
     "platform-administrators": "admin",
     "terraform-administrators": "admin"
 }
+TERRAFORM_ONLY_TEAMS = {"terraform-administrators"}
+NON_TERRAFORM_PERMISSIONS = {
+    team_slug: team_permission
+    for team_slug, team_permission in PERMISSIONS.items()
+    if team_slug not in TERRAFORM_ONLY_TEAMS
+}
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -35,26 +45,80 @@ def create_repository(org: Organization, repo_name: str) -> Repository:
     )
     return repo
 
-def set_repository_permissions(org: Organization, repo: Repository) -> None:
-    for team_slug, team_permission in PERMISSIONS.items():
-        if team_slug == "terraform-administrators" and not repo.name.startswith("tf-"):
-            logger.warning(f"Skipping setting permissions for team {team_slug} on {org.login}/{repo.name}, doesn't appear to be a Terraform repository. Set this permission manually if required.")
-            continue
-        team = org.get_team_by_slug(team_slug)
-        logger.info(f"Setting permissions for team {team_slug} on {org.login}/{repo.name}")
-        team.update_team_repository(repo=repo, permission=team_permission)
-        logger.info(f"Permissions for {team_slug} set to {team_permission}.")
+@functools.lru_cache(maxsize=None)
+def get_team_node_ids(g: Github, org_login: str, team_slugs: tuple[str, ...]) -> dict[str, str]:
+    team_fields = " ".join(f'team_{index}: team(slug: "{team_slug}") {{ id }}' for index, team_slug in enumerate(team_slugs))
+    data = github_graphql(
+        g=g,
+        query=f"query($login: String!) {{ organization(login: $login) {{ {team_fields} }} }}",
+        variables={"login": org_login}
+    )
+    return {team_slug: data["organization"][f"team_{index}"]["id"] for index, team_slug in enumerate(team_slugs)}
+
+def group_teams_by_permission(team_ids: dict[str, str], permissions: dict[str, str]) -> dict[str, list[str]]:
+    teams_by_permission: dict[str, list[str]] = {}
+    for team_slug, team_permission in permissions.items():
+        teams_by_permission.setdefault(team_permission, []).append(team_ids[team_slug])
+    return teams_by_permission
 
-if __name__ == "__main__":
-    try:
-        repo_name = sys.argv[1]
-    except:
-        raise ValueError("Must provide the repo name as the first argument.")
+def set_repository_permissions(g: Github, org: Organization, repos: list[Repository]) -> None:
+    team_ids = get_team_node_ids(g=g, org_login=org.login, team_slugs=tuple(PERMISSIONS))
+    terraform_teams = group_teams_by_permission(team_ids=team_ids, permissions=PERMISSIONS)
+    non_terraform_teams = group_teams_by_permission(team_ids=team_ids, permissions=NON_TERRAFORM_PERMISSIONS)
+    mutations = []
+    for repo_index, repo in enumerate(repos):
+        if repo.name.startswith("tf-"):
+            teams_by_permission = terraform_teams
+        else:
+            teams_by_permission = non_terraform_teams
+            logger.warning(f"Skipping setting permissions for teams {', '.join(sorted(TERRAFORM_ONLY_TEAMS))} on {org.login}/{repo.name}, doesn't appear to be a Terraform repository. Set this permission manually if required.")
+        logger.info(f"Setting team permissions on {org.login}/{repo.name}")
+        for team_permission, permission_team_ids in teams_by_permission.items():
+            mutations.append(
+                f'repo_{repo_index}_{team_permission}: updateTeamsRepository(input: {{repositoryId: "{repo.node_id}", teamIds: {json.dumps(permission_team_ids)}, permission: {team_permission.upper()}}}) {{ clientMutationId }}'
+            )
+    if not mutations:
+        return
+    github_graphql(g=g, query=f"mutation {{ {' '.join(mutations)} }}")
+    logger.info(f"Permissions set for {', '.join(repo.name for repo in repos)}.")
 
-    g = get_github_instance()
+def create_repositories(g: Github, org: Organization, repo_names: list[str], set_permissions: bool = True) -> tuple[list[Repository], list[str]]:
+    created: dict[str, Repository] = {}
+    failed_repo_names = []
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CREATES) as executor:
+        futures = {executor.submit(create_repository, org=org, repo_name=repo_name): repo_name for repo_name in repo_names}
+        for future in as_completed(futures):
+            repo_name = futures[future]
+            try:
+                created[repo_name] = future.result()
+            except Exception:
+                logger.exception(f"Failed to create {org.login}/{repo_name}!")
+                failed_repo_names.append(repo_name)
+    # Repositories that were created still get their permissions when others in the batch failed
+    repos = [created[repo_name] for repo_name in repo_names if repo_name in created]
+    if set_permissions and repos:
+        set_repository_permissions(g=g, org=org, repos=repos)
+    return repos, [repo_name for repo_name in repo_names if repo_name in failed_repo_names]
+
+def main(repo_names: list[str], set_permissions: bool = True) -> int:
+    g = get_github_instance(pool_size=MAX_CONCURRENT_CREATES)
     org = g.get_organization(ORGANIZATION)
 
-    repo = create_repository(org=org, repo_name=repo_name)
-    set_repository_permissions(org=org, repo=repo)
+    repos, failed_repo_names = create_repositories(g=g, org=org, repo_names=repo_names, set_permissions=set_permissions)
+
+    for repo in repos:
+        if set_permissions:
+            logger.info(f"Created {repo.html_url} and set initial permissions.")
+        else:
+            logger.info(f"Created {repo.html_url}.")
+    if failed_repo_names:
+        logger.error(f"Failed to create {', '.join(failed_repo_names)}.")
+        return 1
+    return 0
 
-    logger.info(f"Created {repo.html_url} and set initial permissions.")
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=f"Create one or more repositories in the {ORGANIZATION} organization.")
+    parser.add_argument("repo_names", nargs="+", help="Names of the repositories to create.")
+    parser.add_argument("--no-permissions", action="store_true", help="Skip granting the default team permissions.")
+    args = parser.parse_args()
+    exit(main(repo_names=args.repo_names, set_permissions=not args.no_permissions))
@@ -1,12 +1,25 @@
+import argparse
+import csv
+import json
+import os
 import pathlib
+import queue
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterable, Iterator
 
-from github.Organization import Organization
+from github import Github
+from github.GithubException import GithubException
 from github.Repository import Repository
 
 from git.repo import Repo
 
 from migrate_repo import (
     get_github_instance,
+    rate_limited,
+    wait_for_rate_limit,
     clone_source_repository,
     shell_command,
     logger
@@ -14,106 +27,241 @@ from migrate_repo import (
 
 ORG_NAME = "launchbynttdata"
 WORK_DIR = pathlib.Path().cwd().joinpath("work")
+MAX_WORKERS = os.cpu_count() or 1
+# make configure/check spend much of their time waiting on downloads and tool installs, so each worker runs at least
+# this many jobs even when the workers already cover every CPU
+MIN_MAKE_JOBS = 2
+REPO_LIST_CACHE = WORK_DIR.joinpath(".repo_list.json")
+REPO_LIST_MAX_AGE = 3600
+MODERN_TEST_FILES = (
+    ("post_deploy_functional", "main_test.go"),
+    ("post_deploy_functional_readonly", "main_test.go"),
+    ("testimpl", "test_impl.go"),
+)
+
+@dataclass(frozen=True)
+class CachedRepository:
+    name: str
+    html_url: str
 
 def get_repositories(
-        organization: Organization, 
+        g: Github, 
         repo_name_partial: str = ""
-    ) -> list[Repository]:
-    return [
+    ) -> Iterator[Repository]:
+    # The org listing rather than search: search leaves out forks, lags behind newly created repositories and stops at
+    # 1,000 results
+    return (
         repo 
         for repo 
-        in organization.get_repos() 
+        in g.get_organization(ORG_NAME).get_repos() 
         if repo_name_partial in repo.name
-    ]
+    )
+
+def get_cached_repositories(
+        g: Github,
+        repo_name_partial: str = "",
+        max_age: int = REPO_LIST_MAX_AGE
+    ) -> Iterator[CachedRepository]:
+    if REPO_LIST_CACHE.exists() and time.time() - REPO_LIST_CACHE.stat().st_mtime < max_age:
+        cached = json.loads(REPO_LIST_CACHE.read_text())
+        if cached["repo_name_partial"] == repo_name_partial:
+            logger.info(f"Using cached repository list from {REPO_LIST_CACHE}")
+            yield from (CachedRepository(**repo) for repo in cached["repositories"])
+            return
+    repositories = []
+    for repo in get_repositories(g=g, repo_name_partial=repo_name_partial):
+        repository = CachedRepository(name=repo.name, html_url=repo.html_url)
+        repositories.append(repository)
+        yield repository
+    WORK_DIR.mkdir(exist_ok=True)
+    REPO_LIST_CACHE.write_text(json.dumps({
+        "repo_name_partial": repo_name_partial,
+        "repositories": [asdict(repo) for repo in repositories]
+    }))
+
+def get_named_repositories(g: Github, repo_names: list[str]) -> Iterator[Repository]:
+    wait_for_rate_limit(g=g, required_calls=len(repo_names))
+    get_repo = rate_limited(g.get_repo)
+    for repo_name in repo_names:
+        # A missing or misspelled name is skipped rather than ending the run for every other repository
+        try:
+            repository = get_repo(full_name_or_id=f"{ORG_NAME}/{repo_name}")
+        except GithubException:
+            logger.exception(f"Failed to look up {ORG_NAME}/{repo_name}, skipping it")
+            continue
+        yield repository
+
+def refresh_clone(repo_path: pathlib.Path) -> Repo:
+    local_repo = Repo(path=repo_path)
+    logger.info(f"Refreshing existing clone at {repo_path}")
+    local_repo.remotes.origin.fetch(depth=1)
+    local_repo.git.reset("--hard", f"origin/{local_repo.active_branch.name}")
+    local_repo.git.clean("-fdx")
+    return local_repo
 
-def clone(repository: Repository) -> Repo:
+def clone(repository: Repository | CachedRepository) -> Repo:
+    repo_path = WORK_DIR.joinpath(repository.name)
+    if repo_path.joinpath(".git").exists():
+        try:
+            return refresh_clone(repo_path=repo_path)
+        except Exception as e:
+            logger.warning(f"Failed to refresh {repo_path}, cloning again: {e}")
     return clone_source_repository(
         source_repo_name=repository.name,
         work_dir=WORK_DIR,
-        source_org=ORG_NAME
+        source_org=ORG_NAME,
+        shallow=True
     )
 
-def make_check_succeeds(repo: Repo) -> bool:
+def make_jobs(max_workers: int) -> int:
+    if "MAKE_JOBS" in os.environ:
+        return int(os.environ["MAKE_JOBS"])
+    return max(MIN_MAKE_JOBS, (os.cpu_count() or 1) // max_workers)
+
+def make_check_succeeds(repo: Repo, jobs: int = 1) -> bool:
     try:
-        shell_command(source_repo=repo, command=["make", "configure"], raise_on_failure=True)
+        shell_command(source_repo=repo, command=["make", "-j", str(jobs), "configure"], raise_on_failure=True)
     except Exception as e:
-        print(f"{repo} failed to make configure: {e}")
+        logger.error(f"{repo} failed to make configure: {e}")
         return False
     try:
-        shell_command(source_repo=repo, command=["make", "check"], raise_on_failure=True)
+        shell_command(source_repo=repo, command=["make", "-j", str(jobs), "check"], raise_on_failure=True)
     except Exception as e:
-        print(f"{repo} failed to make check: {e}")
+        logger.error(f"{repo} failed to make check: {e}")
         return False
     return True
 
+def scan_directory(path: str) -> dict[str, os.DirEntry] | None:
+    try:
+        with os.scandir(path) as entries:
+            return {entry.name: entry for entry in entries}
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
 def has_an_example(repo: Repo) -> bool:
-    example_folder = pathlib.Path(repo.working_dir).joinpath("examples")
-    if not example_folder.exists():
+    example_folder = os.path.join(repo.working_dir, "examples")
+    example_entries = scan_directory(example_folder)
+    if example_entries is None:
         logger.error(f"No directory found at {example_folder}")
         return False
-    examples_subdirs = [f for f in example_folder.iterdir() if f.is_dir()]
+    examples_subdirs = [entry for entry in example_entries.values() if entry.is_dir()]
     if not examples_subdirs:
         logger.error(f"No examples directories found in {example_folder}")
         return False
-    return any([folder.joinpath("main.tf").exists() for folder in examples_subdirs])
+    return any(os.path.isfile(os.path.join(entry.path, "main.tf")) for entry in examples_subdirs)
 
 def has_modern_tests(repo: Repo) -> bool:
-    tests_folder = pathlib.Path(repo.working_dir).joinpath("tests")
-    if not tests_folder.exists():
+    tests_folder = f"{repo.working_dir}/tests"
+    if not os.path.isdir(tests_folder):
         logger.error(f"No directory found at {tests_folder}")
         return False
-    post_deploy_functional_folder = tests_folder.joinpath("post_deploy_functional")
-    if not post_deploy_functional_folder.exists():
-        logger.error(f"No directory found at {post_deploy_functional_folder}")
-        return False
-    post_deploy_functional_main = post_deploy_functional_folder.joinpath("main_test.go")
-    if not post_deploy_functional_main.exists():
-        logger.error(f"No main_test.go found in {post_deploy_functional_folder}")
-        return False
-    post_deploy_functional_readonly_folder = tests_folder.joinpath("post_deploy_functional_readonly")
-    if not post_deploy_functional_readonly_folder.exists():
-        logger.error(f"No directory found at {post_deploy_functional_readonly_folder}")
-        return False
-    post_deploy_functional_readonly_main = post_deploy_functional_readonly_folder.joinpath("main_test.go")
-    if not post_deploy_functional_readonly_main.exists():
-        logger.error(f"No main_test.go found in {post_deploy_functional_readonly_folder}")
-        return False
-    testimpl_folder = tests_folder.joinpath("testimpl")
-    if not testimpl_folder.exists():
-        logger.error(f"No directory found at {testimpl_folder}")
-        return False
-    test_implementation = testimpl_folder.joinpath("test_impl.go")
-    if not test_implementation.exists():
-        logger.error(f"No test_impl.go found in {testimpl_folder}")
-        return False
+    for folder_name, file_name in MODERN_TEST_FILES:
+        folder = f"{tests_folder}/{folder_name}"
+        if not os.path.isfile(f"{folder}/{file_name}"):
+            if os.path.isdir(folder):
+                logger.error(f"No {file_name} found in {folder}")
+            else:
+                logger.error(f"No directory found at {folder}")
+            return False
     return True
 
-def main(filter_repos_to: list[str] | None = None) -> None:
-    results: dict[Repository, tuple[bool, bool, bool]] = {}
-    org = get_github_instance(token_suffix=ORG_NAME).get_organization(login=ORG_NAME)
-    tf_repos = get_repositories(organization=org, repo_name_partial="tf-")
+def clone_repositories(
+        repositories: Iterable[Repository | CachedRepository],
+        cloned_repos: queue.Queue,
+        consumers: int
+    ) -> None:
+    try:
+        for repository in repositories:
+            try:
+                cloned_repos.put((repository, clone(repository=repository)))
+            except Exception:
+                logger.exception(f"Failed to clone {repository.name}")
+    finally:
+        for _ in range(consumers):
+            cloned_repos.put(None)
+
+def check_cloned_repositories(
+        cloned_repos: queue.Queue,
+        report: Callable[[Repository | CachedRepository, tuple[bool, bool, bool]], None],
+        jobs: int,
+        always_make_check: bool = False
+    ) -> None:
+    while (cloned := cloned_repos.get()) is not None:
+        repository, local_repo = cloned
+        try:
+            example = has_an_example(repo=local_repo)
+            tests = has_modern_tests(repo=local_repo)
+            if always_make_check or (example and tests):
+                make_check = make_check_succeeds(repo=local_repo, jobs=jobs)
+            else:
+                logger.info(f"Skipping make check for {repository.name}, static checks already failed")
+                make_check = False
+            report(repository, (example, tests, make_check))
+        except Exception:
+            logger.exception(f"Failed to check {repository.name}")
+
+def main(
+        filter_repos_to: list[str] | None = None,
+        max_workers: int = MAX_WORKERS,
+        max_age: int = REPO_LIST_MAX_AGE,
+        always_make_check: bool = False
+    ) -> None:
+    g = get_github_instance(token_suffix=ORG_NAME, pool_size=max_workers)
     if filter_repos_to:
-        tf_repos = [repo for repo in tf_repos if repo.name in filter_repos_to]
+        tf_repos = get_named_repositories(g=g, repo_names=filter_repos_to)
+    else:
+        tf_repos = get_cached_repositories(g=g, repo_name_partial="tf-", max_age=max_age)
+    jobs = make_jobs(max_workers=max_workers)
+
+    # Rows are written as each repository finishes so partial results survive a crash.
+    writer = csv.writer(sys.stdout)
+    writer_lock = threading.Lock()
+    writer.writerow(["repo_name", "repo_url", "has_example", "has_tests", "make_check"])
+    sys.stdout.flush()
+
+    def report(repository: Repository | CachedRepository, result: tuple[bool, bool, bool]) -> None:
+        with writer_lock:
+            writer.writerow([repository.name, repository.html_url, *result])
+            sys.stdout.flush()
+
+    # Clones are fed through a bounded queue so cloning the next repositories overlaps with
+    # make running on the current ones, without cloning everything up front.
+    cloned_repos = queue.Queue(maxsize=max_workers)
+    workers = [
+        threading.Thread(
+            target=clone_repositories,
+            kwargs={"repositories": tf_repos, "cloned_repos": cloned_repos, "consumers": max_workers},
+            daemon=True
+        )
+    ]
+    workers.extend(
+        threading.Thread(
+            target=check_cloned_repositories,
+            kwargs={
+                "cloned_repos": cloned_repos,
+                "report": report,
+                "jobs": jobs,
+                "always_make_check": always_make_check
+            },
+            daemon=True
+        )
+        for _ in range(max_workers)
+    )
     try:
-        for repo in tf_repos:
-            local_repo = clone(repository=repo)
-            results[repo] = (
-                has_an_example(repo=local_repo),
-                has_modern_tests(repo=local_repo),
-                make_check_succeeds(repo=local_repo)
-            )
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
     except KeyboardInterrupt:
-        print("\nCtrl-C\n")
-    finally:
-        print("repo_name,repo_url,has_example,has_tests,make_check")
-        for repo, results in results.items():
-            print(f"{repo.name},{repo.html_url},{results[0]},{results[1]},{results[2]}")
+        print("\nCtrl-C\n", file=sys.stderr)
 
 if __name__ == "__main__":
-    # repo_name_list = [
-    #     "tf-azurerm-module_collection-hubspoke_monitor",
-    #     "tf-azurerm-module_primitive-network_interface_security_group_association",
-    #     "tf-azurerm-module_primitive-public_ip"
-    # ]
-    # main(filter_repos_to=repo_name_list)
-    main()
+    parser = argparse.ArgumentParser(
+        description=f"Report on the health of Terraform repositories in the {ORG_NAME} organization.",
+        epilog=f"Set MAKE_JOBS to choose the -j passed to make configure and make check. Defaults to the CPU count divided by the number of workers, but at least {MIN_MAKE_JOBS}."
+    )
+    parser.add_argument("repo_names", nargs="*", help="Only check these repositories. Defaults to every tf- repository.")
+    parser.add_argument("--always-make-check", action="store_true", help="Run make check even when a repository has no example or tests.")
+    parser.add_argument("--max-age", type=int, default=REPO_LIST_MAX_AGE, help=f"Reuse the cached repository list if it is newer than this many seconds. Pass 0 to refresh it. Defaults to {REPO_LIST_MAX_AGE}.")
+    args = parser.parse_args()
+    main(filter_repos_to=args.repo_names, max_age=args.max_age, always_make_check=args.always_make_check)
@@ -1,4 +1,7 @@
+import os
 import sys
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from migrate_repo import get_github_instance, clone_source_repository, discover_files
 import pathlib
 import logging
@@ -6,22 +9,29 @@ import logging
 from github import Github
 from github.Repository import Repository
 from github.Organization import Organization
+from github.Team import Team
 
 
+# Defaults to INFO; set LOG_LEVEL=DEBUG for verbose output
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
     format="%(asctime)s\t%(name)s\t%(levelname)s\t%(message)s",
     datefmt="%F %T %Z",
+    # migrate_repo has already configured the root logger at import
+    force=True,
 )
 logger = logging.getLogger("permission_verifier")
 logging.getLogger("git").setLevel(logging.INFO)
 logging.getLogger("urllib3").setLevel(logging.INFO)
+logging.getLogger("github").setLevel(logging.WARNING)
 
 ORG = "launchbynttdata"
+# Stay well under GitHub's secondary rate limit on concurrent requests
+MAX_WORKERS = 8
 
 def get_org_repositories(organization: Organization, name_filter: str = "") -> list[Repository]:
-    all_repos = [r for r in organization.get_repos()]
-    return [r for r in all_repos if name_filter in r.name]
+    # The org listing rather than search: search leaves out forks and lags behind repositories a migration just created
+    return [r for r in organization.get_repos() if name_filter in r.name]
 
 
 def create_work_dir(root_path: pathlib.Path = pathlib.Path.cwd()) -> pathlib.Path:
@@ -31,15 +41,20 @@ def create_work_dir(root_path: pathlib.Path = pathlib.Path.cwd()) -> pathlib.Pat
     return work_dir
 
 
+@functools.lru_cache(maxsize=None)
+def get_team(organization: Organization, team_slug: str) -> Team:
+    return organization.get_team_by_slug(team_slug)
+
+
 def fix_permissions(github_object: Github, repository: Repository, organization: Organization) -> None:
-    platform_team = organization.get_team_by_slug("platform-team")
-    platform_administrators = organization.get_team_by_slug("platform-administrators")
+    platform_team = get_team(organization, "platform-team")
+    platform_administrators = get_team(organization, "platform-administrators")
 
     platform_team.update_team_repository(repo=repository, permission="maintain")
     platform_administrators.update_team_repository(repo=repository, permission="admin")
 
     if repository.name.startswith("tf-"):
-        terraform_administrators = organization.get_team_by_slug("terraform-administrators")
+        terraform_administrators = get_team(organization, "terraform-administrators")
         terraform_administrators.update_team_repository(repo=repository, permission="admin")
     
     logger.info(f"Finished setting permissions for {repository.name}")
@@ -48,7 +63,7 @@ def main(repo_name_prefix: str = "tf-") -> int:
     work_dir = create_work_dir()
 
     try:
-        github_object = get_github_instance(token_suffix=ORG)
+        github_object = get_github_instance(token_suffix=ORG, pool_size=MAX_WORKERS)
     except Exception as e:
         logger.exception("Failed to retrieve Github instance!")
         return -1
@@ -68,12 +83,21 @@ def main(repo_name_prefix: str = "tf-") -> int:
             logger.error("Aborted!")
             return 1   
 
+    # Resolve the teams up front so the workers don't race to fetch them
+    for team_slug in ["platform-team", "platform-administrators", "terraform-administrators"]:
+        get_team(organization, team_slug)
+
     outcomes = []
-    for repository in all_repositories:
-        try:
-            fix_permissions(github_object, repository, organization)
-        except Exception as e:
-            outcomes.append(f"EXCEPTION for {repository.name}: {e}")
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(fix_permissions, github_object, repository, organization): repository
+            for repository in all_repositories
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                outcomes.append(f"EXCEPTION for {futures[future].name}: {e}")
     print("\n".join(outcomes))
 
 if __name__ == "__main__":
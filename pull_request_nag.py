@@ -1,9 +1,51 @@
+import logging
 import os
-import itertools
+from dataclasses import dataclass
+from typing import Iterable, Iterator
 
 from github import Github, Auth
-from github.Organization import Organization
-from github.PullRequest import PullRequest
+
+from migrate_repo import github_graphql
+
+# migrate_repo configures logging at DEBUG when it's imported, which would otherwise log every request PyGithub makes
+logging.getLogger("github").setLevel(logging.WARNING)
+
+# Open PRs are listed through each repository's pullRequests connection rather than search, which stops at 1,000 results.
+# A page of repositories carries the first 100 open PRs of each; the rare repository with more is paged separately.
+ORG_OPEN_PULL_REQUESTS_QUERY = """
+query($org: String!, $cursor: String) {
+  organization(login: $org) {
+    repositories(first: 100, after: $cursor) {
+      nodes {
+        name
+        pullRequests(states: OPEN, first: 100) {
+          nodes { url author { login } }
+          pageInfo { hasNextPage endCursor }
+        }
+      }
+      pageInfo { hasNextPage endCursor }
+    }
+  }
+}
+"""
+REPOSITORY_OPEN_PULL_REQUESTS_QUERY = """
+query($org: String!, $name: String!, $cursor: String) {
+  repository(owner: $org, name: $name) {
+    pullRequests(states: OPEN, first: 100, after: $cursor) {
+      nodes { url author { login } }
+      pageInfo { hasNextPage endCursor }
+    }
+  }
+}
+"""
+
+
+@dataclass(frozen=True)
+class OutstandingPullRequest:
+    repository: str
+    author: str
+    html_url: str
+
 
 def read_github_token(token_suffix: str | None = None) -> str:
     env_var_name = "GITHUB_TOKEN"
@@ -30,26 +72,93 @@ def get_github_instance(
     return Github(auth=auth)
 
 
+def to_outstanding_pull_requests(repository_name: str, nodes: list[dict]) -> Iterator[OutstandingPullRequest]:
+    for node in nodes:
+        yield OutstandingPullRequest(
+            repository=repository_name,
+            # Deleted accounts come back without an author
+            author=(node["author"] or {"login": "ghost"})["login"],
+            html_url=node["url"],
+        )
+
+
+def remaining_pull_requests(
+        g: Github,
+        organization_login: str,
+        repository_name: str,
+        cursor: str
+    ) -> Iterator[OutstandingPullRequest]:
+    while cursor:
+        pull_requests = github_graphql(
+            g=g,
+            query=REPOSITORY_OPEN_PULL_REQUESTS_QUERY,
+            variables={"org": organization_login, "name": repository_name, "cursor": cursor},
+        )["repository"]["pullRequests"]
+        yield from to_outstanding_pull_requests(repository_name=repository_name, nodes=pull_requests["nodes"])
+        cursor = pull_requests["pageInfo"]["endCursor"] if pull_requests["pageInfo"]["hasNextPage"] else None
+
+
+def open_pull_requests(
+        g: Github,
+        organization_login: str,
+        author_login: str | None = None
+    ) -> Iterator[OutstandingPullRequest]:
+    pull_requests = every_open_pull_request(g=g, organization_login=organization_login)
+    if author_login:
+        pull_requests = (pr for pr in pull_requests if pr.author == author_login)
+    return pull_requests
+
+
+def every_open_pull_request(g: Github, organization_login: str) -> Iterator[OutstandingPullRequest]:
+    cursor = None
+    while True:
+        repositories = github_graphql(
+            g=g,
+            query=ORG_OPEN_PULL_REQUESTS_QUERY,
+            variables={"org": organization_login, "cursor": cursor},
+        )["organization"]["repositories"]
+        for repository in repositories["nodes"]:
+            pull_requests = repository["pullRequests"]
+            yield from to_outstanding_pull_requests(repository_name=repository["name"], nodes=pull_requests["nodes"])
+            if pull_requests["pageInfo"]["hasNextPage"]:
+                yield from remaining_pull_requests(
+                    g=g,
+                    organization_login=organization_login,
+                    repository_name=repository["name"],
+                    cursor=pull_requests["pageInfo"]["endCursor"],
+                )
+        if not repositories["pageInfo"]["hasNextPage"]:
+            return
+        cursor = repositories["pageInfo"]["endCursor"]
+
+
 def org_outstanding_pull_requests(
-        organization: Organization, 
+        g: Github,
+        organization_login: str,
         repo_name_partial: str | None = "",
-        user_login_partial: str | None = ""
-    ) -> list[PullRequest]:
-    repositories = [repo for repo in organization.get_repos() if repo_name_partial in repo.name]
-    pull_requests: list[PullRequest] = itertools.chain.from_iterable([repo.get_pulls(state="open") for repo in repositories])
-    filtered_by_user = [pull_request for pull_request in pull_requests if user_login_partial in pull_request.user.login]
-    return filtered_by_user
+        user_login_partial: str | None = "",
+        author_login: str | None = None
+    ) -> Iterator[OutstandingPullRequest]:
+    pull_requests = open_pull_requests(g=g, organization_login=organization_login, author_login=author_login)
+    # Empty or None partials match everything, so only filter on the ones that were given
+    if repo_name_partial:
+        pull_requests = (pr for pr in pull_requests if repo_name_partial in pr.repository)
+    if user_login_partial:
+        pull_requests = (pr for pr in pull_requests if user_login_partial in pr.author)
+    return pull_requests
 
 
-def display(pull_requests: list[PullRequest]):
+def display(pull_requests: Iterable[OutstandingPullRequest]):
     for pr in pull_requests:
-        print(f"{pr.user.login} - {pr.html_url}")
+        print(f"{pr.author} - {pr.html_url}")
 
 
-display(
-    org_outstanding_pull_requests(
-        organization=get_github_instance(token_suffix="launchbynttdata").get_organization("launchbynttdata"),
-        repo_name_partial="",
-        user_login_partial=""
+if __name__ == "__main__":
+    display(
+        org_outstanding_pull_requests(
+            g=get_github_instance(token_suffix="launchbynttdata"),
+            organization_login="launchbynttdata",
+            repo_name_partial="",
+            user_login_partial=""
+        )
     )
-)
\ No newline at end of file
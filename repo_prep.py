@@ -4,22 +4,34 @@ import os
 import pathlib
 import json
 import sys
+import types
+from typing import Iterable
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 from github import Auth, Github
+from github.Branch import Branch
 from github.Repository import Repository
 from github.Team import Team
 from github.Organization import Organization
-from github.GithubException import UnknownObjectException
+from github.GithubException import GithubException
 
 
+# Defaults to INFO; set LOG_LEVEL=DEBUG for verbose output
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
     format="%(asctime)s\t%(name)s\t%(levelname)s\t%(message)s",
     datefmt="%F %T %Z",
 )
 logger = logging.getLogger("repo_prep")
 logging.getLogger("git").setLevel(logging.INFO)
 logging.getLogger("urllib3").setLevel(logging.INFO)
+logging.getLogger("github").setLevel(logging.WARNING)
+
+# Stay well under GitHub's secondary rate limit on concurrent requests
+MAX_WORKERS = 8
+# The REST API maximum, instead of PyGithub's default of 30, so paginated listings need a third of the requests
+GITHUB_PAGE_SIZE = 100
 
 
 class GithubPermission(str, Enum):
@@ -46,13 +58,16 @@ def github_headers(token_suffix: str | None = None) -> dict[str, str]:
     return {"Authorization": f"Bearer {read_github_token(token_suffix=token_suffix)}"}
 
 
+@functools.lru_cache(maxsize=None)
 def get_github_instance(
     token: str | None = None, token_suffix: str | None = None
 ) -> Github:
     if not token:
         token = read_github_token(token_suffix=token_suffix)
     auth = Auth.Token(token)
-    return Github(auth=auth)
+    # One connection per worker thread so concurrent calls reuse kept-alive connections. PyGithub's default
+    # GithubRetry already backs off on 429s and secondary rate limit 403s.
+    return Github(auth=auth, pool_size=MAX_WORKERS, per_page=GITHUB_PAGE_SIZE)
 
 
 def create_repo(organization: Organization, repo_name: str) -> Repository:
@@ -68,6 +83,11 @@ def create_repo(organization: Organization, repo_name: str) -> Repository:
     return created_repo
 
 
+@functools.lru_cache(maxsize=None)
+def get_team(organization: Organization, team_slug: str) -> Team:
+    return organization.get_team_by_slug(team_slug)
+
+
 def configure_repo_permissions(
     repository: Repository, team: Team, permission: GithubPermission
 ):
@@ -76,6 +96,14 @@ def configure_repo_permissions(
 
 
 def update_repo_settings(repository: Repository):
+    if (
+        repository.allow_merge_commit is False
+        and repository.allow_rebase_merge is False
+        and repository.delete_branch_on_merge
+        and repository.allow_update_branch
+    ):
+        logger.info(f"Settings are already correct for {repository}")
+        return
     logger.info(
         f"Setting allow_merge_commit=False, allow_rebase_merge=False, delete_branch_on_merge=True, allow_update_branch=True for {repository}"
     )
@@ -87,16 +115,34 @@ def update_repo_settings(repository: Repository):
     )
 
 
+@functools.lru_cache(maxsize=4)
+def list_org_repositories(organization: Organization) -> dict[str, Repository]:
+    return {r.name: r for r in organization.get_repos()}
+
+
 def get_repositories(
     g: Github, organization: Organization, starts_with: str = ""
 ) -> list[Repository]:
-    return [r for r in organization.get_repos() if r.name.startswith(starts_with)]
+    return [r for name, r in list_org_repositories(organization).items() if name.startswith(starts_with)]
 
 
-def load_repo_map():
+@functools.lru_cache(maxsize=1)
+def load_repo_map() -> types.MappingProxyType:
     # return json.loads(pathlib.Path("nexient-llc-repos-rename-map.json").read_text())
     rename_map: dict[str, str] = json.loads(pathlib.Path("nexient-llc-repos-rename-map.json").read_text())
-    return {k: v for k, v in rename_map.items() if k.startswith("tf-az")}
+    # Read-only, since every caller shares the cached mapping
+    return types.MappingProxyType({k: v for k, v in rename_map.items() if k.startswith("tf-az")})
+
+
+@functools.lru_cache(maxsize=1)
+def old_repo_names() -> tuple[str, ...]:
+    return tuple(load_repo_map().keys())
+
+
+@functools.lru_cache(maxsize=1)
+def new_repo_names() -> tuple[str, ...]:
+    return tuple(load_repo_map().values())
+
 
 def assign_permissions_to_existing_repos_in_new_organization(
     organization: Organization,
@@ -133,89 +179,99 @@ def assign_permissions_to_existing_repos_in_new_organization(
         ]
     }
 
+    platform_team = get_team(organization, "platform-team")
+    platform_administrators = get_team(organization, "platform-administrators")
+    lcaf_administrators = get_team(organization, "lcaf-administrators")
+    terraform_administrators = get_team(organization, "terraform-administrators")
+
     permission_map = {
         "lcaf": {
-            organization.get_team_by_slug("platform-team"): GithubPermission.MAINTAIN,
-            organization.get_team_by_slug(
-                "platform-administrators"
-            ): GithubPermission.ADMIN,
-            organization.get_team_by_slug(
-                "lcaf-administrators"
-            ): GithubPermission.ADMIN,
+            platform_team: GithubPermission.MAINTAIN,
+            platform_administrators: GithubPermission.ADMIN,
+            lcaf_administrators: GithubPermission.ADMIN,
         },
         "lcaf_tf": {
-            organization.get_team_by_slug("platform-team"): GithubPermission.MAINTAIN,
-            organization.get_team_by_slug(
-                "platform-administrators"
-            ): GithubPermission.ADMIN,
-            organization.get_team_by_slug(
-                "terraform-administrators"
-            ): GithubPermission.ADMIN,
-            organization.get_team_by_slug(
-                "lcaf-administrators"
-            ): GithubPermission.ADMIN,
+            platform_team: GithubPermission.MAINTAIN,
+            platform_administrators: GithubPermission.ADMIN,
+            terraform_administrators: GithubPermission.ADMIN,
+            lcaf_administrators: GithubPermission.ADMIN,
         },
         "general": {
-            organization.get_team_by_slug("platform-team"): GithubPermission.MAINTAIN,
-            organization.get_team_by_slug(
-                "platform-administrators"
-            ): GithubPermission.ADMIN,
+            platform_team: GithubPermission.MAINTAIN,
+            platform_administrators: GithubPermission.ADMIN,
         },
         "tf": {
-            organization.get_team_by_slug("platform-team"): GithubPermission.MAINTAIN,
-            organization.get_team_by_slug(
-                "platform-administrators"
-            ): GithubPermission.ADMIN,
-            organization.get_team_by_slug(
-                "terraform-administrators"
-            ): GithubPermission.ADMIN,
+            platform_team: GithubPermission.MAINTAIN,
+            platform_administrators: GithubPermission.ADMIN,
+            terraform_administrators: GithubPermission.ADMIN,
         },
     }
 
+    repositories = []
+    permission_tasks = []
     for map_type, map_permissions in permission_map.items():
         if map_type in existing_repos:
             for repo_name in existing_repos[map_type]:
                 repository = organization.get_repo(name=repo_name)
+                repositories.append(repository)
                 for team, permission in map_permissions.items():
-                    configure_repo_permissions(
-                        repository=repository, team=team, permission=permission
-                    )
-                    update_repo_settings(repository=repository)
+                    permission_tasks.append((repository, team, permission))
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        # list() so that any exception raised by a worker is re-raised here
+        list(
+            executor.map(
+                lambda task: configure_repo_permissions(
+                    repository=task[0], team=task[1], permission=task[2]
+                ),
+                permission_tasks,
+            )
+        )
+        list(
+            executor.map(
+                lambda repository: update_repo_settings(repository=repository),
+                repositories,
+            )
+        )
 
 
 def assign_migration_group_admin_permissions(
     organization: Organization, repositories: list[Repository]
 ):
-    migration_team = organization.get_team_by_slug("azure-migrations")
-    for repository in repositories:
-        configure_repo_permissions(
-            repository=repository,
-            team=migration_team,
-            permission=GithubPermission.ADMIN,
+    migration_team = get_team(organization, "azure-migrations")
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        list(
+            executor.map(
+                lambda repository: configure_repo_permissions(
+                    repository=repository,
+                    team=migration_team,
+                    permission=GithubPermission.ADMIN,
+                ),
+                repositories,
+            )
         )
 
 
 def unassign_migration_group_admin_permissions(
     organization: Organization, repositories: list[Repository]
 ):
-    migration_team = organization.get_team_by_slug("azure-migrations")
-    for repository in repositories:
+    migration_team = get_team(organization, "azure-migrations")
+
+    def remove_migration_team(repository: Repository):
         logger.info(f"Removing {migration_team} from {repository}")
         migration_team.remove_from_repos(repo=repository)
 
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        list(executor.map(remove_migration_team, repositories))
+
 
 def create_migration_targets(organization: Organization):
-    repo_map = load_repo_map()
     permission_map = {
-        organization.get_team_by_slug("platform-team"): GithubPermission.MAINTAIN,
-        organization.get_team_by_slug(
-            "platform-administrators"
-        ): GithubPermission.ADMIN,
-        organization.get_team_by_slug(
-            "terraform-administrators"
-        ): GithubPermission.ADMIN,
+        get_team(organization, "platform-team"): GithubPermission.MAINTAIN,
+        get_team(organization, "platform-administrators"): GithubPermission.ADMIN,
+        get_team(organization, "terraform-administrators"): GithubPermission.ADMIN,
     }
-    for new_repo in repo_map.values():
+    for new_repo in new_repo_names():
         try:
             created_repo = create_repo(organization=organization, repo_name=new_repo)
         except Exception as e:
@@ -228,16 +284,19 @@ def create_migration_targets(organization: Organization):
             configure_repo_permissions(
                 repository=created_repo, team=team, permission=permission
             )
+    # The organization's repository listing no longer includes everything
+    list_org_repositories.cache_clear()
 
 
 def get_existing_repositories(
-    organization: Organization, repo_names: list[str]
+    organization: Organization, repo_names: Iterable[str]
 ) -> list[Repository]:
+    repos_by_name = list_org_repositories(organization)
     found_repos = []
     for repo_name in repo_names:
-        try:
-            found_repos.append(organization.get_repo(name=repo_name))
-        except UnknownObjectException:
+        if repo_name in repos_by_name:
+            found_repos.append(repos_by_name[repo_name])
+        else:
             logger.warning(
                 f"Repository '{repo_name}' didn't exist within {organization}"
             )
@@ -245,13 +304,12 @@ def get_existing_repositories(
 
 
 def initiate_migration(old_organization: Organization, new_organization: Organization):
-    repo_map = load_repo_map()
     old_org_repositories = get_existing_repositories(
-        organization=old_organization, repo_names=list(repo_map.keys())
+        organization=old_organization, repo_names=old_repo_names()
     )
     create_migration_targets(organization=new_organization)
     new_org_repositories = get_existing_repositories(
-        organization=new_organization, repo_names=list(repo_map.values())
+        organization=new_organization, repo_names=new_repo_names()
     )
     assign_migration_group_admin_permissions(
         organization=old_organization, repositories=old_org_repositories
@@ -261,31 +319,51 @@ def initiate_migration(old_organization: Organization, new_organization: Organiz
     )
 
 
+def migration_status_row(
+    old_organization: Organization, new_organization: Organization, old_repo_name: str, new_repo_name: str
+) -> tuple[Repository, Repository, Branch | None]:
+    old_repo = old_organization.get_repo(old_repo_name)
+    new_repo = new_organization.get_repo(new_repo_name)
+    return old_repo, new_repo, get_main_branch(repository=new_repo)
+
+
 def migration_status(old_organization: Organization, new_organization: Organization):
     repo_map = load_repo_map()
     migrated_repo_names = set([])
-    for old_repo_name, new_repo_name in repo_map.items():
-        old_repo = old_organization.get_repo(old_repo_name)
-        new_repo = new_organization.get_repo(new_repo_name)
-        print(
-            wide_display(
-                old_repo=old_repo,
-                new_repo=new_repo,
-            )
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        rows = executor.map(
+            lambda names: migration_status_row(old_organization, new_organization, *names),
+            repo_map.items(),
         )
-        if len([b for b in new_repo.get_branches()]):
-            migrated_repo_names.add(new_repo.name)
-            migrated_repo_names.add(old_repo.name)
+        # map() yields in submission order, so the output stays in rename map order
+        for old_repo, new_repo, new_main_branch in rows:
+            print(
+                wide_display(
+                    old_repo=old_repo,
+                    new_repo=new_repo,
+                    new_main_branch=new_main_branch,
+                )
+            )
+            if new_main_branch is not None:
+                migrated_repo_names.add(new_repo.name)
+                migrated_repo_names.add(old_repo.name)
     
     print("MIGRATED: ")
     print("\n".join(migrated_repo_names))
 
 
-def wide_display(old_repo: Repository, new_repo: Repository):
-    old_is_archived = f"Archived: {old_repo.archived}"
+def get_main_branch(repository: Repository) -> Branch | None:
     try:
-        new_has_main = f"Has Main: {new_repo.get_branch('main')}"
-    except:
+        return repository.get_branch("main")
+    except GithubException:
+        return None
+
+
+def wide_display(old_repo: Repository, new_repo: Repository, new_main_branch: Branch | None):
+    old_is_archived = f"Archived: {old_repo.archived}"
+    if new_main_branch is not None:
+        new_has_main = f"Has Main: {new_main_branch}"
+    else:
         new_has_main = f"Has Main: NOT FOUND"
     text_lines = []
     text_lines.append(f"{old_repo.name.rjust(80)} => {new_repo.name.ljust(80)}")
@@ -294,12 +372,11 @@ def wide_display(old_repo: Repository, new_repo: Repository):
 
 
 def complete_migration(old_organization: Organization, new_organization: Organization):
-    repo_map = load_repo_map()
     old_org_repositories = get_existing_repositories(
-        organization=old_organization, repo_names=list(repo_map.keys())
+        organization=old_organization, repo_names=old_repo_names()
     )
     new_org_repositories = get_existing_repositories(
-        organization=new_organization, repo_names=list(repo_map.values())
+        organization=new_organization, repo_names=new_repo_names()
     )
     unassign_migration_group_admin_permissions(
         organization=old_organization, repositories=old_org_repositories
@@ -310,12 +387,11 @@ def complete_migration(old_organization: Organization, new_organization: Organiz
 
 
 def reset_migration(old_organization: Organization, new_organization: Organization):
-    repo_map = load_repo_map()
     old_org_repositories = get_existing_repositories(
-        organization=old_organization, repo_names=list(repo_map.keys())
+        organization=old_organization, repo_names=old_repo_names()
     )
     new_org_repositories = get_existing_repositories(
-        organization=new_organization, repo_names=list(repo_map.values())
+        organization=new_organization, repo_names=new_repo_names()
     )
     unassign_migration_group_admin_permissions(
         organization=old_organization, repositories=old_org_repositories
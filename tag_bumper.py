@@ -40,6 +40,8 @@ DISCOVERY_FORBIDDEN_DIRECTORIES = [
 ]
 
 ORG = "launchbynttdata"
+# The REST API maximum, instead of PyGithub's default of 30, so paginated listings need a third of the requests
+GITHUB_PAGE_SIZE = 100
 
 def read_github_token(token_suffix: str | None = None) -> str:
     env_var_name = "GITHUB_TOKEN"
@@ -63,7 +65,7 @@ def get_github_instance(
     if not token:
         token = read_github_token(token_suffix=token_suffix)
     auth = Auth.Token(token)
-    return Github(auth=auth)
+    return Github(auth=auth, per_page=GITHUB_PAGE_SIZE)
 
 
 def create_work_dir(root_path: pathlib.Path = pathlib.Path.cwd()) -> pathlib.Path:
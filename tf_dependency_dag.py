@@ -1,14 +1,20 @@
 from graphviz import Digraph
 import pathlib
 import re
-from git import Head, TagReference
+from git import GitCommandError, Head, TagReference
 from dataclasses import dataclass
-from typing import Self
+from typing import Callable, Iterator, Self
 from contextlib import suppress
-import itertools
 import shutil
-from functools import cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import defaultdict, deque
 import os
+import threading
+import json
+import functools
+import random
+import time
+import mmap
 
 from git.repo import Repo
 from github import Auth, Github
@@ -16,12 +22,24 @@ from github.Repository import Repository
 from github.AuthenticatedUser import AuthenticatedUser
 from github.Organization import Organization
 
+from migrate_repo import GITHUB_PAGE_SIZE, github_graphql
+
 WORK_DIR = pathlib.Path().cwd().joinpath("work")
+BARE_DIR = WORK_DIR.joinpath(".bare")
+DAG_CACHE_DIR = WORK_DIR.joinpath(".dag-cache")
 DIAGRAM_DIR = pathlib.Path().cwd().joinpath("dependency_diagrams")
-SOURCE_RE = re.compile(r'source\s*=\s*"(.+)"', flags=re.IGNORECASE)
+# Matched against raw bytes so only the captured sources are decoded, not the whole file
+SOURCE_RE = re.compile(rb'source\s*=\s*"(.+)"', flags=re.IGNORECASE)
+# Smaller files are read outright; mapping them costs more than the copy it saves
+MMAP_MIN_BYTES = 4096
 MOD_RE = re.compile(r'(tf-[a-z0-9_-]+)', flags=re.IGNORECASE)
-URL_RE = re.compile(r"(git::)?(?P<proto>https?)?(://)?github\.com/(?P<org>[a-z0-9_-]+)/(?P<repo>[a-z0-9_-]+)(\.git)?\?ref=(?P<ref>.+)")
-ALT_URL_RE = re.compile(r"(git@github.com:)(?P<org>[a-z0-9_-]+)/(?P<repo>[a-z0-9_-]+)(\.git)?\?ref=(?P<ref>.+)")
+GITHUB_SOURCE_PREFIXES = (
+    "https://github.com/",
+    "http://github.com/",
+    "ssh://git@github.com/",
+    "git@github.com:",
+    "github.com/",
+)
 
 OrganizationName = str
 RepositoryName = str
@@ -29,7 +47,33 @@ Revision = str
 
 SplitUrl = tuple[OrganizationName, RepositoryName, Revision | None]
 
-module_cache: dict[str, object] = {}
+MAX_WORKERS = 8
+# Every checkout is a worktree of one blobless bare clone per repository, so a repository referenced at several refs or
+# by several tasks is only downloaded once and blobs are fetched just for the files that get checked out.
+BARE_CLONE_OPTIONS = ["--filter=blob:none"]
+
+# GitHub limits a GraphQL query to 500,000 nodes; 100 aliased repository lookups stays far below that
+REPOSITORY_BATCH_SIZE = 100
+REPOSITORY_FIELDS = "name nameWithOwner url"
+
+# Every built module, shared by extract_dependencies and the from_* constructors. Keys are "org/repo" for resolved
+# dependencies, (full_name, ref) for from_repository and the resolved path for from_directory.
+module_cache: dict[str | tuple[str, str | None], object] = {}
+# One lock per module so concurrent tasks don't clone and parse the same dependency twice. Dependencies form a DAG,
+# so locks are always taken in the same order and can't deadlock.
+module_locks: defaultdict[str | tuple[str, str | None], threading.RLock] = defaultdict(threading.RLock)
+module_locks_lock = threading.Lock()
+
+# Clones and fetches that fail (network hiccups, GitHub throttling) are retried with exponential backoff and full jitter
+GIT_NETWORK_MAX_ATTEMPTS = 4
+GIT_NETWORK_BACKOFF_SECONDS = 1
+GIT_NETWORK_MAX_BACKOFF_SECONDS = 30
+
+# Bare clones that were already brought up to date during this run
+fetched_bare_repos: set[str] = set()
+
+# Each task clones into its own subdirectory of WORK_DIR so that concurrent tasks never clobber each other's checkouts
+task_state = threading.local()
 
 migrated_repo_names = [
     "tf-module-resource_name",
@@ -72,8 +116,9 @@ migrated_repo_names = [
     "tf-azurerm-module_primitive-resource_group",
     "tf-azurerm-module_primitive-firewall_policy",
 ]
+MIGRATED_REPO_NAMES = frozenset(migrated_repo_names)
 
-DISCOVERY_FORBIDDEN_DIRECTORIES = [
+DISCOVERY_FORBIDDEN_DIRECTORIES = frozenset([
     ".git",
     "components",
     ".repo",
@@ -81,7 +126,7 @@ DISCOVERY_FORBIDDEN_DIRECTORIES = [
     ".venv",
     ".terraform",
     ".terragrunt-cache"
-]
+])
 
 def read_github_token() -> str:
     try:
@@ -98,7 +143,22 @@ def get_github_instance(token: str | None = None) -> Github:
     if not token:
         token = read_github_token()
     auth = Auth.Token(token)
-    return Github(auth=auth)
+    # Every task thread shares this client, so the pool has to hold a keep-alive connection for each of them
+    return Github(auth=auth, per_page=GITHUB_PAGE_SIZE, pool_size=MAX_WORKERS)
+
+def find_module_sources(main_tf: pathlib.Path) -> list[str]:
+    with open(main_tf, "rb") as f:
+        if os.fstat(f.fileno()).st_size < MMAP_MIN_BYTES:
+            return [source.decode() for source in SOURCE_RE.findall(f.read())]
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return [source.decode() for source in SOURCE_RE.findall(mapped)]
+
+def current_work_dir() -> pathlib.Path:
+    return getattr(task_state, "work_dir", WORK_DIR)
+
+def module_lock(module_key: str | tuple[str, str | None]) -> threading.RLock:
+    with module_locks_lock:
+        return module_locks[module_key]
 
 def get_github_repos(g: Github, user_or_org: AuthenticatedUser | Organization | None = None) -> list[Repository]:
     if user_or_org:
@@ -107,6 +167,93 @@ def get_github_repos(g: Github, user_or_org: AuthenticatedUser | Organization |
         repos = g.get_user().get_repos()
     return [repo for repo in repos]
 
+def batch_fetch_repositories(full_names: list[str]) -> dict[str, Repository | None]:
+    """Look up many repositories with one GraphQL request per REPOSITORY_BATCH_SIZE names instead of one REST call each.
+
+    Args:
+        full_names (list[str]): Repository names in org/repo form
+
+    Returns:
+        dict[str, Repository | None]: Repository objects keyed by the requested name, or None for repositories that don't exist
+    """
+    repositories = {}
+    for start in range(0, len(full_names), REPOSITORY_BATCH_SIZE):
+        batch = full_names[start:start + REPOSITORY_BATCH_SIZE]
+        parameters = ", ".join(f"$owner{i}: String!, $name{i}: String!" for i in range(len(batch)))
+        lookups = " ".join(f"r{i}: repository(owner: $owner{i}, name: $name{i}) {{ {REPOSITORY_FIELDS} }}" for i in range(len(batch)))
+        variables = {}
+        for i, full_name in enumerate(batch):
+            variables[f"owner{i}"], variables[f"name{i}"] = full_name.split("/", 1)
+        data = github_graphql(g=g, query=f"query({parameters}) {{ {lookups} }}", variables=variables, allow_not_found=True)
+        for i, full_name in enumerate(batch):
+            node = data.get(f"r{i}")
+            if node is None:
+                repositories[full_name] = None
+                continue
+            # Only the attributes from_repository reads are filled in, so nothing triggers a lazy REST fetch
+            repositories[full_name] = g.create_from_raw_data(Repository, {
+                "name": node["name"],
+                "full_name": node["nameWithOwner"],
+                "url": f"https://api.github.com/repos/{node['nameWithOwner']}",
+                "html_url": node["url"],
+                "clone_url": f"{node['url']}.git",
+                "git_url": f"git://github.com/{node['nameWithOwner']}.git",
+            })
+    return repositories
+
+def retry_git_network(fn: Callable) -> Callable:
+    """Decorator that retries a git network operation, backing off exponentially with jitter between attempts."""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        for attempt in range(GIT_NETWORK_MAX_ATTEMPTS):
+            try:
+                return fn(*args, **kwargs)
+            except GitCommandError as e:
+                if attempt == GIT_NETWORK_MAX_ATTEMPTS - 1:
+                    raise
+                delay = random.uniform(0, min(GIT_NETWORK_MAX_BACKOFF_SECONDS, GIT_NETWORK_BACKOFF_SECONDS * 2 ** attempt))
+                print(f"{fn.__name__} failed with exit code {e.status}, retrying in {delay:.1f} seconds")
+                time.sleep(delay)
+
+    return wrapper
+
+@retry_git_network
+def clone_bare(clone_url: str, bare_path: pathlib.Path) -> Repo:
+    try:
+        return Repo.clone_from(url=clone_url, to_path=bare_path, bare=True, multi_options=BARE_CLONE_OPTIONS)
+    except GitCommandError:
+        # Don't leave a partial clone behind for the next attempt to mistake for a complete one
+        if bare_path.exists():
+            shutil.rmtree(bare_path)
+        raise
+
+@retry_git_network
+def fetch_bare(bare: Repo):
+    bare.git.fetch("origin", "+refs/heads/*:refs/heads/*", "--tags", "--prune")
+
+def bare_repository(clone_url: str) -> Repo:
+    github_org, github_repo = clone_url.removesuffix(".git").split("/")[-2:]
+    bare_path = BARE_DIR.joinpath(github_org, f"{github_repo}.git")
+    with module_lock(str(bare_path)):
+        if not bare_path.exists():
+            bare = clone_bare(clone_url=clone_url, bare_path=bare_path)
+        else:
+            bare = Repo(path=bare_path)
+            if str(bare_path) not in fetched_bare_repos:
+                fetch_bare(bare=bare)
+        fetched_bare_repos.add(str(bare_path))
+    return bare
+
+def remove_worktree(bare: Repo, target_directory: pathlib.Path):
+    if target_directory.exists():
+        try:
+            bare.git.worktree("remove", "--force", str(target_directory))
+        except GitCommandError:
+            # Not one of our worktrees, e.g. a full clone left behind by an older run
+            shutil.rmtree(target_directory)
+    bare.git.worktree("prune")
+
 def sync_repo(target_directory: pathlib.Path, clone_url: str, repo_ref: str | None = None) -> Repo | None:
     """Sync a Git repository.
 
@@ -116,43 +263,43 @@ def sync_repo(target_directory: pathlib.Path, clone_url: str, repo_ref: str | No
         repo_ref (str | None, optional): Revision to check out. Defaults to None, which will try to check out 'main' (or 'master' if 'main' is not found)
 
     Returns:
-        bool: Success (True) or Failure (False)
+        Repo | None: Worktree checked out at the requested revision, or None on failure
     """
-    if target_directory.exists():
-        shutil.rmtree(target_directory)
-    try:
-        repo = Repo.clone_from(url=clone_url, to_path=target_directory)
-    except:
-        repo = Repo.clone_from(url=clone_url, to_path=target_directory)
-
-    if repo_ref is None:
-        try:
-            repo.git.checkout("main")
-        except:
+    bare = bare_repository(clone_url=clone_url)
+    with module_lock(bare.git_dir):
+        remove_worktree(bare=bare, target_directory=target_directory)
+        for revision in (["main", "master"] if repo_ref is None else [repo_ref]):
             try:
-                repo.git.checkout("master")
-            except:
-                print(f"Failed to fully clone {clone_url}, cannot check out expected branches of 'main' and 'master'")
-                return
+                bare.git.worktree("add", "--detach", "--force", str(target_directory), revision)
+                return Repo(path=target_directory)
+            except GitCommandError:
+                remove_worktree(bare=bare, target_directory=target_directory)
+    if repo_ref is None:
+        print(f"Failed to fully clone {clone_url}, cannot check out expected branches of 'main' and 'master'")
     else:
-        try:
-            repo.git.checkout(repo_ref)
-        except:
-            print(f"Failed to fully clone {clone_url}, cannot check out '{repo_ref}'")
-            return
-    return repo
-
-
-def discover_files(root_path: pathlib.Path, filename_partial: str) -> list[pathlib.Path]:
-    directories = [d for d in root_path.iterdir() if d.is_dir() and not d.name.lower() in DISCOVERY_FORBIDDEN_DIRECTORIES]
-    files = [f for f in root_path.iterdir() if not f.is_dir() and filename_partial in f.name.lower()]
-    files.extend(list(itertools.chain.from_iterable([discover_files(root_path=d, filename_partial=filename_partial) for d in directories])))
-    return files
-
-def discover_directories(root_path: pathlib.Path, dirname_partial: str) -> list[pathlib.Path]:
-    directories = [d for d in root_path.iterdir() if d.is_dir() and dirname_partial in d.name and not d.name.lower() in DISCOVERY_FORBIDDEN_DIRECTORIES]
-    directories.extend(list(itertools.chain.from_iterable([discover_directories(root_path=d, dirname_partial=dirname_partial) for d in directories])))
-    return directories
+        print(f"Failed to fully clone {clone_url}, cannot check out '{repo_ref}'")
+
+
+def discover_files(root_path: pathlib.Path, filename_partial: str) -> Iterator[pathlib.Path]:
+    pending_directories = [os.fspath(root_path)]
+    while pending_directories:
+        with os.scandir(pending_directories.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if entry.name.lower() not in DISCOVERY_FORBIDDEN_DIRECTORIES:
+                        pending_directories.append(entry.path)
+                elif filename_partial in entry.name.lower():
+                    yield pathlib.Path(entry.path)
+
+def discover_directories(root_path: pathlib.Path, dirname_partial: str) -> Iterator[pathlib.Path]:
+    # Only directories that match are descended into
+    pending_directories = [os.fspath(root_path)]
+    while pending_directories:
+        with os.scandir(pending_directories.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir() and dirname_partial in entry.name and entry.name.lower() not in DISCOVERY_FORBIDDEN_DIRECTORIES:
+                    pending_directories.append(entry.path)
+                    yield pathlib.Path(entry.path)
 
 @dataclass
 class ExternalTerraformModule:
@@ -180,20 +327,21 @@ class GitEnabledTerraformModule:
 
     @staticmethod
     def build_repo_path(repo_name: str):
-        return WORK_DIR.joinpath(repo_name)
+        return current_work_dir().joinpath(repo_name)
     
     @staticmethod
     def split_github_url(url: str) -> SplitUrl:
-        result = URL_RE.match(string=url)
-        if result is None:
-            result = ALT_URL_RE.match(string=url)
-        if result is None:
-            print(f"Failure to parse GitHub URL: {url=}")
-            breakpoint()
-        ref = None
-        with suppress(Exception):
-            ref = result['ref']
-        return result['org'], result['repo'], ref
+        location, _, ref = url.removeprefix("git::").partition("?ref=")
+        for prefix in GITHUB_SOURCE_PREFIXES:
+            if location.startswith(prefix):
+                path_parts = location.removeprefix(prefix).split("/")
+                break
+        else:
+            path_parts = []
+        if len(path_parts) < 2 or not all(path_parts[:2]):
+            raise ValueError(f"Failure to parse GitHub URL: {url=}")
+        # Anything after org/repo is a subdirectory (repo.git//modules/x), which doesn't change the repository
+        return path_parts[0], path_parts[1].removesuffix(".git"), ref or None
 
     @staticmethod
     def extract_examples(target_dir: pathlib.Path) -> list[Self]:
@@ -208,27 +356,35 @@ class GitEnabledTerraformModule:
         main_tf = target_dir.joinpath("main.tf")
         if not main_tf.exists():
             return deps
-        main_tf_contents = main_tf.read_text()
-        dependency_references = re.findall(pattern=SOURCE_RE, string=main_tf_contents)
+        dependency_references = find_module_sources(main_tf=main_tf)
         with suppress(ValueError):
               dependency_references.remove("../..")
               dependency_references = [d.replace("git::", "") for d in dependency_references]
+        split_references = {
+            dep_ref: GitEnabledTerraformModule.split_github_url(dep_ref)
+            for dep_ref in dependency_references if 'github.com' in dep_ref
+        }
+        # Resolve every GitHub dependency of this module in one batch rather than a REST call per dependency
+        uncached_names = list(dict.fromkeys(
+            f"{github_org}/{github_repo}"
+            for github_org, github_repo, _ in split_references.values()
+            if f"{github_org}/{github_repo}" not in module_cache
+        ))
+        remote_repos = batch_fetch_repositories(full_names=uncached_names) if uncached_names else {}
         for dep_ref in dependency_references:
             if 'github.com' in dep_ref:
-                github_org, github_repo, github_ref = GitEnabledTerraformModule.split_github_url(dep_ref)
-                if not f"{github_org}/{github_repo}" in module_cache:
-                    try:
-                        remote_repo = g.get_repo(full_name_or_id=f"{github_org}/{github_repo}")
-                    except Exception as e:
-                        print(f"Failed to acquire remote_repo {github_org}/{github_repo}")
-                        raise
-                    try:
-                        github_module = GitEnabledTerraformModule.from_directory(directory=WORK_DIR.joinpath(github_repo))
-                    except Exception as e:
-                        github_module = GitEnabledTerraformModule.from_repository(repository=remote_repo, ref=github_ref)
-                    finally:
-                        if not f"{github_org}/{github_repo}" in module_cache:
-                            module_cache[f"{github_org}/{github_repo}"] = github_module
+                github_org, github_repo, github_ref = split_references[dep_ref]
+                with module_lock(f"{github_org}/{github_repo}"):
+                    if not f"{github_org}/{github_repo}" in module_cache:
+                        remote_repo = remote_repos.get(f"{github_org}/{github_repo}")
+                        if remote_repo is None:
+                            print(f"Failed to acquire remote_repo {github_org}/{github_repo}")
+                            raise RuntimeError(f"Repository {github_org}/{github_repo} not found")
+                        try:
+                            github_module = GitEnabledTerraformModule.from_directory(directory=current_work_dir().joinpath(github_repo))
+                        except Exception as e:
+                            github_module = GitEnabledTerraformModule.from_repository(repository=remote_repo, ref=github_ref)
+                        module_cache[f"{github_org}/{github_repo}"] = github_module
                 deps.append(module_cache[f"{github_org}/{github_repo}"])
             else:
                 deps.append(ExternalTerraformModule(name=dep_ref))
@@ -236,26 +392,25 @@ class GitEnabledTerraformModule:
 
     @staticmethod
     def head_or_tag(local_repo: Repo) -> Head | TagReference:
-        active_revision = local_repo.head
-        for t in local_repo.tags:
-            if active_revision.commit == t.commit:
-                return t
-        return active_revision
+        # git matches tags against HEAD itself (peeling annotated tags) instead of resolving every tag's commit here
+        tag_names = local_repo.git.tag("--points-at", "HEAD").splitlines()
+        if tag_names:
+            return local_repo.tags[tag_names[0]]
+        return local_repo.head
     
     @classmethod
-    @cache
     def from_repository(cls, repository: Repository, ref: str|None = None):
-        target_directory = GitEnabledTerraformModule.build_repo_path(repo_name=repository.name)
-        
-        if target_directory.exists():
-           shutil.rmtree(target_directory)
-           target_directory.mkdir(exist_ok=False)
+        cache_key = (repository.full_name, ref)
+        with module_lock(cache_key):
+            if cache_key not in module_cache:
+                module_cache[cache_key] = cls._build_from_repository(repository=repository, ref=ref)
+            return module_cache[cache_key]
 
-        try:
-            local_repo = sync_repo(target_directory=target_directory, clone_url=repository.clone_url, repo_ref=ref)
-        except:
-            local_repo = sync_repo(target_directory=target_directory, clone_url=repository.clone_url, repo_ref=ref)
+    @classmethod
+    def _build_from_repository(cls, repository: Repository, ref: str|None = None):
+        target_directory = GitEnabledTerraformModule.build_repo_path(repo_name=repository.name)
 
+        local_repo = sync_repo(target_directory=target_directory, clone_url=repository.clone_url, repo_ref=ref)
         if not local_repo:
             raise RuntimeError(f"Failed to construct GitEnabledTerraformModule from {repository.name} {repository.git_url}")
         local_path = pathlib.Path(local_repo.working_tree_dir)
@@ -270,8 +425,15 @@ class GitEnabledTerraformModule:
         )
     
     @classmethod
-    @cache
     def from_directory(cls, directory: pathlib.Path):
+        cache_key = str(directory.resolve())
+        with module_lock(cache_key):
+            if cache_key not in module_cache:
+                module_cache[cache_key] = cls._build_from_directory(directory=directory)
+            return module_cache[cache_key]
+
+    @classmethod
+    def _build_from_directory(cls, directory: pathlib.Path):
         git_directory = directory
         if not git_directory.exists():
             raise RuntimeError(f"Supplied directory {directory} does not exist!")
@@ -314,58 +476,90 @@ class GitEnabledTerraformModule:
             for dep in self.dependencies:
                 dep.prettyprint(tabs=tabs+1)
     
-    def get_viz_deps(self, in_example: bool = False):
-        dag: dict[str, set[str]] = {self.name: set([d.name for d in self.dependencies])}
-        for dependency in self.dependencies:
-            if isinstance(dependency, GitEnabledTerraformModule):
-                for k, v in dependency.get_viz_deps(True).items():
-                    dag[k] = v
+    def get_viz_deps(self, in_example: bool = False) -> dict[str, set[str]]:
+        # Shared dependencies are visited once; only this module's own examples are included, not those of dependencies
+        pending: deque[GitEnabledTerraformModule] = deque([self])
         if self.examples is not None and not in_example:
-            for example in self.examples:
-                if isinstance(example, GitEnabledTerraformModule):
-                    for k, v in example.get_viz_deps(True).items():
-                        dag[k] = v
+            pending.extend(example for example in self.examples if isinstance(example, GitEnabledTerraformModule))
+        dag: dict[str, set[str]] = {}
+        while pending:
+            module = pending.popleft()
+            if module.name in dag:
+                continue
+            dag[module.name] = {d.name for d in module.dependencies}
+            pending.extend(d for d in module.dependencies if isinstance(d, GitEnabledTerraformModule))
         return dag
 
 
 
+def dependency_node_style(name: str) -> dict[str, str]:
+    if 'depr' in name:
+        return {"fillcolor": "red", "style": "filled"}
+    if name in MIGRATED_REPO_NAMES:
+        return {"fillcolor": "darkolivegreen2", "style": "filled"}
+    if name.count("/") == 2:
+        return {"fillcolor": "darkolivegreen1", "style": "filled"}
+    return {}
+
 def build_viz_from_dag(viz: Digraph, dag: dict[str, set[str]]) -> Digraph:
+    # Each node is styled and emitted once. A module that is also someone's dependency takes the dependency style.
+    node_styles: dict[str, dict[str, str]] = {}
+    for key, value in dag.items():
+        if key not in node_styles:
+            node_styles[key] = {"fillcolor": "red", "style": "filled"} if 'depr' in key else {}
+        for v in value:
+            node_styles[v] = dependency_node_style(v)
+    for name, style in node_styles.items():
+        viz.node(name, **style)
     for key, value in dag.items():
-        if 'depr' in key:
-            viz.node(key, fillcolor="red", style="filled")
-        else:
-            viz.node(key)
         for v in value:
-            if 'depr' in v:
-                viz.node(v, fillcolor="red", style="filled")
-            elif v in migrated_repo_names:
-                viz.node(v, fillcolor="darkolivegreen2", style="filled")
-            elif v.count("/") == 2:
-                viz.node(v, fillcolor="darkolivegreen1", style="filled")
-            else:
-                viz.node(v)
             viz.edge(v, key)
     return viz
 
+def dag_cache_path(repo_name: str, sha: str) -> pathlib.Path:
+    return DAG_CACHE_DIR.joinpath(f"{repo_name}@{sha}.json")
+
+def load_cached_dag(repo_name: str, sha: str) -> dict[str, set[str]] | None:
+    try:
+        cached = json.loads(dag_cache_path(repo_name=repo_name, sha=sha).read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return {key: set(value) for key, value in cached.items()}
+
+def save_cached_dag(repo_name: str, sha: str, dag: dict[str, set[str]]):
+    DAG_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    dag_cache_path(repo_name=repo_name, sha=sha).write_text(json.dumps({key: sorted(value) for key, value in dag.items()}))
+
+def process_one(tf_repo: Repository) -> str:
+    task_state.work_dir = WORK_DIR.joinpath(tf_repo.name)
+    task_state.work_dir.mkdir(exist_ok=True)
+    try:
+        # A module's graph only changes when its default branch moves, so unchanged repositories skip the clone and
+        # parse entirely. Dependencies are pinned by ref and assumed not to be retagged.
+        head_sha = tf_repo.get_branch(tf_repo.default_branch).commit.sha
+        dag = load_cached_dag(repo_name=tf_repo.name, sha=head_sha)
+        if dag is None:
+            dag = GitEnabledTerraformModule.from_repository(repository=tf_repo).get_viz_deps()
+            save_cached_dag(repo_name=tf_repo.name, sha=head_sha, dag=dag)
+        if all([len(v) == 0 for v in dag.values()]):
+            return "no dependencies to render."
+        viz = Digraph(comment=f"Terraform Dependencies for {tf_repo.name}")
+        viz = build_viz_from_dag(viz=viz, dag=dag)
+        # Piping the source to dot avoids writing, rereading and deleting an intermediate .gv file per diagram
+        DIAGRAM_DIR.joinpath(f"tf-dag-{tf_repo.name}.png").write_bytes(viz.pipe(format="png"))
+    except Exception as e:
+        return f"failed: {e}!"
+    return "rendered."
+
 def main():
     WORK_DIR.mkdir(exist_ok=True)
+    DIAGRAM_DIR.mkdir(exist_ok=True)
 
     tf_repos = [r for r in g.get_organization('nexient-llc').get_repos() if r.name.startswith('tf-aws')]
-    for tf_repo in tf_repos:
-        print(f"Processing graph for {tf_repo.name.ljust(80)}", end="")
-        try:
-            repo = GitEnabledTerraformModule.from_repository(repository=tf_repo)
-            dag = repo.get_viz_deps()
-            if all([len(v) == 0 for v in dag.values()]):
-                print(f"no dependencies to render.")
-                continue
-            viz = Digraph(comment=f"Terraform Dependencies for {repo.name}")
-            viz = build_viz_from_dag(viz=viz, dag=dag)
-            viz.render(str(DIAGRAM_DIR.joinpath(f"tf-dag-{repo.name}")), format="png", cleanup=True)
-        except Exception as e:
-            print(f"failed: {e}!")
-            continue
-        print("rendered.")
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(process_one, tf_repo): tf_repo for tf_repo in tf_repos}
+        for future in as_completed(futures):
+            print(f"Processing graph for {futures[future].name.ljust(80)}{future.result()}")
 
 g = get_github_instance()
 
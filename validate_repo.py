@@ -1,5 +1,8 @@
+import os
 import sys
 import pathlib
+import re
+import hashlib
 
 from git.repo import Repo
 
@@ -16,30 +19,25 @@ from migrate_repo import (
 )
 
 SOURCE_ORG = "launchbynttdata"
+# Shared by every `terraform init` that `make check` runs, so providers are downloaded once rather than per repository.
+# Terraform doesn't make the cache safe for concurrent inits, which is fine here as repositories are validated one at a time.
+TERRAFORM_PLUGIN_CACHE_DIR = pathlib.Path.home().joinpath(".terraform.d", "plugin-cache")
+# Everything `make configure` reads from the repository. When none of these have changed since the last successful
+# run in the same working copy, the components it synced and the tools it installed are still current.
+CONFIGURE_INPUT_FILES = ("Makefile", ".lcafenv", ".tool-versions")
+# Kept in the .git directory so it is never committed and disappears along with the working copy
+CONFIGURE_MARKER_FILE = "make-configure.blake2b"
+# v1.0.0 through v1.0.3 are all replaced by v1.0.4
+TERRATEST_VERSION_RE = re.compile(r"github\.com/launchbynttdata/lcaf-component-terratest v1\.0\.[0-3](?!\d)")
 
 def go_mod_terratest_fix(repo: Repo):
     work_dir = pathlib.Path(repo.working_dir)
     go_mod_file = work_dir.joinpath("go.mod")
     go_mod_contents = go_mod_file.read_text()
     
-    go_mod_contents_fixed = go_mod_contents.replace(
-        "github.com/launchbynttdata/lcaf-component-terratest v1.0.0",
-        "github.com/launchbynttdata/lcaf-component-terratest v1.0.4"
-    )
-
-    go_mod_contents_fixed = go_mod_contents_fixed.replace(
-        "github.com/launchbynttdata/lcaf-component-terratest v1.0.1",
-        "github.com/launchbynttdata/lcaf-component-terratest v1.0.4"
-    )
-
-    go_mod_contents_fixed = go_mod_contents_fixed.replace(
-        "github.com/launchbynttdata/lcaf-component-terratest v1.0.2",
-        "github.com/launchbynttdata/lcaf-component-terratest v1.0.4"
-    )
-
-    go_mod_contents_fixed = go_mod_contents_fixed.replace(
-        "github.com/launchbynttdata/lcaf-component-terratest v1.0.3",
-        "github.com/launchbynttdata/lcaf-component-terratest v1.0.4"
+    go_mod_contents_fixed = TERRATEST_VERSION_RE.sub(
+        "github.com/launchbynttdata/lcaf-component-terratest v1.0.4",
+        go_mod_contents
     )
 
     if go_mod_contents != go_mod_contents_fixed:
@@ -71,8 +69,49 @@ def test_impl_simple_env_var_fix(repo: Repo):
         test_impl_file.write_text(test_impl_contents_fixed)
 
 
+def refresh_or_clone(source_repo_name: str, work_dir: pathlib.Path) -> Repo:
+    repo_path = work_dir.joinpath(source_repo_name)
+    if repo_path.joinpath(".git").exists():
+        try:
+            local_repo = Repo(path=repo_path)
+            logger.info(f"Refreshing existing working copy at {repo_path}")
+            local_repo.remotes.origin.fetch(tags=True, force=True)
+            local_repo.git.checkout("main")
+            local_repo.git.reset("--hard", "origin/main")
+            # Without -x, the ignored components/ and .repo/ directories left by `make configure` survive
+            local_repo.git.clean("-fd")
+            return local_repo
+        except Exception as e:
+            logger.warning(f"Failed to refresh {repo_path}, cloning again: {e}")
+    return clone_source_repository(source_repo_name=source_repo_name, work_dir=work_dir, source_org=SOURCE_ORG)
+
+def configure_inputs_hash(repo: Repo) -> str:
+    work_dir = pathlib.Path(repo.working_dir)
+    digest = hashlib.blake2b(digest_size=16)
+    for file_name in CONFIGURE_INPUT_FILES:
+        input_file = work_dir.joinpath(file_name)
+        # The name separates "missing" from "empty" and keeps one file's bytes from shifting into the next
+        digest.update(file_name.encode() + b"\0")
+        if input_file.exists():
+            digest.update(input_file.read_bytes())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def make_configure(repo: Repo):
+    marker = pathlib.Path(repo.git_dir).joinpath(CONFIGURE_MARKER_FILE)
+    inputs_hash = configure_inputs_hash(repo=repo)
+    components_synced = pathlib.Path(repo.working_dir).joinpath("components", "Makefile").exists()
+    if components_synced and marker.exists() and marker.read_text() == inputs_hash:
+        logger.info("Makefile, .lcafenv and .tool-versions are unchanged since the last `make configure`, skipping it")
+        return
+    marker.unlink(missing_ok=True)
+    _ = shell_command(source_repo=repo, command=["make", "configure"], raise_on_failure=True)
+    marker.write_text(inputs_hash)
+
 def has_changes(repo: Repo) -> bool:
-    return repo.is_dirty(untracked_files=True)
+    # One `git status` instead of the separate index, working tree and untracked checks is_dirty runs. Untracked
+    # directories such as .terraform are reported without being walked.
+    return bool(repo.git.status("--porcelain=v1", "-z", "--untracked-files=normal"))
 
 def push_changes_and_move_tag(repo: Repo):
     repo.git.push(["origin", "main"])
@@ -80,13 +119,19 @@ def push_changes_and_move_tag(repo: Repo):
     repo.git.tag(["1.0.0"])
     repo.git.push(["origin", "1.0.0", "-f"])
 
+def enable_terraform_plugin_cache():
+    # An explicitly configured cache wins; terraform ignores the setting if the directory doesn't exist
+    plugin_cache_dir = pathlib.Path(os.environ.setdefault("TF_PLUGIN_CACHE_DIR", str(TERRAFORM_PLUGIN_CACHE_DIR)))
+    plugin_cache_dir.mkdir(parents=True, exist_ok=True)
+
 def main(source_repo_name: str) -> int:
     work_dir = create_work_dir()
+    enable_terraform_plugin_cache()
     repo_rename_map = load_repo_rename_map()
     if source_repo_name in repo_rename_map:
         source_repo_name = repo_rename_map[source_repo_name]
-    source_repo = clone_source_repository(source_repo_name=source_repo_name, work_dir=work_dir, source_org=SOURCE_ORG)
-    _ = shell_command(source_repo=source_repo, command=["make", "configure"], raise_on_failure=True)
+    source_repo = refresh_or_clone(source_repo_name=source_repo_name, work_dir=work_dir)
+    make_configure(repo=source_repo)
     
     go_mod_terratest_fix(repo=source_repo)
     test_impl_simple_env_var_fix(repo=source_repo)